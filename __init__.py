@@ -9,15 +9,16 @@ bl_info = {
     "description": "PES SEF importer/exporter",
     "category": "Import-Export" }
 
+import os
 import bpy
-from bpy.props import StringProperty
+from bpy.props import StringProperty, CollectionProperty, BoolProperty, EnumProperty
 from bpy_extras.io_utils import (ImportHelper, ExportHelper, path_reference_mode)
 
 ###########################################
 # Menus
 ###########################################
 
-from .import_actions import load_sef
+from .import_actions import load_sef, load_sef_variants
 
 class ImportSEF(bpy.types.Operator, ImportHelper):
     """Load a SEF File"""
@@ -27,12 +28,24 @@ class ImportSEF(bpy.types.Operator, ImportHelper):
 
     filename_ext = ".sef"
     filter_glob: StringProperty(
-            default="*.sef",
+            default="*.sef;*.sef.gz;*.sef.xz",
             options={'HIDDEN'},
             )
+    files: CollectionProperty(
+            type=bpy.types.OperatorFileListElement,
+            options={'HIDDEN', 'SKIP_SAVE'},
+            )
+    directory: StringProperty(
+            subtype='DIR_PATH',
+            options={'HIDDEN', 'SKIP_SAVE'},
+            )
 
     def execute(self, context):
         keywords = self.as_keywords(ignore=("filter_glob",))
+        filepaths = [os.path.join(self.directory, f.name) for f in self.files if f.name]
+        if len(filepaths) > 1:
+            # Several weather variants of the same stadium, load them sharing geometry
+            return load_sef_variants(filepaths)
         return load_sef(keywords['filepath'])
 
     def draw(self, context):
@@ -41,7 +54,8 @@ class ImportSEF(bpy.types.Operator, ImportHelper):
 def menu_func_import(self, context):
     self.layout.operator(ImportSEF.bl_idname, text="PES SEF (.sef)")
 
-from .export_actions import save_sef
+from .export_actions import save_sef, save_sef_background, group_names
+from .sef_definitions import sef_compression
 
 class ExportSEF(bpy.types.Operator, ExportHelper):
     """Save a SEF File"""
@@ -51,16 +65,82 @@ class ExportSEF(bpy.types.Operator, ExportHelper):
 
     filename_ext = ".sef"
     filter_glob: StringProperty(
-            default="*.sef",
+            default="*.sef;*.sef.gz;*.sef.xz",
             options={'HIDDEN'},
             )
+    use_selection: BoolProperty(
+            name="Selected Objects",
+            description="Export selected objects only",
+            default=False,
+            )
+    use_visible: BoolProperty(
+            name="Visible Objects",
+            description="Export visible objects only",
+            default=False,
+            )
+    use_background: BoolProperty(
+            name="Write in Background",
+            description="Write the file on a separate thread after collecting the scene, so Blender stays usable",
+            default=False,
+            )
+    compression: EnumProperty(
+            name="Compression",
+            description="Compress the written file",
+            items=[('NONE', "From File Name", "Plain .sef, unless the file name ends in .sef.gz or .sef.xz"),
+                   ('GZ', "Gzip", "Gzip compressed .sef.gz file"),
+                   ('XZ', "XZ", "XZ compressed .sef.xz file")],
+            default='NONE',
+            )
+    export_groups: EnumProperty(
+            name="Groups",
+            description="Groups to export, all groups when none is chosen",
+            items=[(name, name, "") for name in group_names],
+            options={'ENUM_FLAG'},
+            default=set(),
+            )
+
+    def check(self, context):
+        # Show the file that will really be written, so the overwrite warning checks it too
+        change = super().check(context)
+        filepath = sef_export_path(self.filepath, self.compression)
+        if filepath != self.filepath:
+            self.filepath = filepath
+            change = True
+        return change
 
     def execute(self, context):
         keywords = self.as_keywords(ignore=("filter_glob",))
-        return save_sef(keywords['filepath'])
+        filepath = sef_export_path(keywords['filepath'], self.compression)
+        save = save_sef_background if self.use_background else save_sef
+        return save(filepath,
+                        use_selection=self.use_selection,
+                        use_visible=self.use_visible,
+                        groups=set(self.export_groups))
 
     def draw(self, context):
-        pass
+        layout = self.layout
+        layout.prop(self, "use_selection")
+        layout.prop(self, "use_visible")
+        layout.prop(self, "use_background")
+        layout.prop(self, "compression")
+        layout.label(text="Groups:")
+        grid = layout.grid_flow(columns=2, even_columns=True, align=True)
+        grid.prop(self, "export_groups", expand=True)
+
+def sef_export_path(filepath, compression):
+    # ExportHelper only knows about .sef, so rebuild the full extension for the chosen compression
+    base = filepath
+    typed = 'NONE'
+    while os.path.splitext(base)[1].lower() in (".sef", ".gz", ".xz"):
+        # Keep the compression of an extension typed by the user, like SEFWorld.save does,
+        # ExportHelper may have appended .sef after it
+        if typed == 'NONE':
+            typed = {'gz': 'GZ', 'xz': 'XZ'}.get(sef_compression(base), 'NONE')
+        base = os.path.splitext(base)[0]
+    if compression == 'NONE':
+        compression = typed
+    ext = {'NONE': ".sef", 'GZ': ".sef.gz", 'XZ': ".sef.xz"}[compression]
+    return base + ext
 
 def menu_func_export(self, context):
     self.layout.operator(ExportSEF.bl_idname, text="PES SEF (.sef)")
@@ -17,106 +17,339 @@
 #
 # ***** END GPL LICENCE BLOCK *****
 
-import string, traceback
+import re, string, threading, traceback
+from array import array
 import bpy
 
 from .sef_definitions import *
 
-def save_sef(filepath):
-	with open(filepath, 'w', newline='\r\n') as file:
+def save_sef(filepath, use_selection=False, use_visible=False, groups=None):
+	try:
+		scope = resolve_export_scope(bpy.context.scene, bpy.context.view_layer, use_selection, use_visible, groups)
+		report_export_scope(scope)
+		check_export_names(scope)
+		# Objects are written as they are extracted, so write to a temporary file that
+		# only replaces the target once every object was exported
+		write_sef_atomic(filepath, lambda file: save_world_streaming(file, scope))
+	except Exception as e:
+		print('Error saving file!')
+		print(traceback.format_exc())
+		return {'CANCELLED'}
+	return {'FINISHED'}
+
+def save_sef_background(filepath, use_selection=False, use_visible=False, groups=None):
+	"""
+	Copies the scene into flat arrays on the main thread, then builds the SEF objects and writes
+	the file on a worker thread so Blender stays usable. The result is shown by a timer once the
+	worker is done
+	"""
+	try:
+		scope = resolve_export_scope(bpy.context.scene, bpy.context.view_layer, use_selection, use_visible, groups)
+		report_export_scope(scope)
+		check_export_names(scope)
+		snapshot = snapshot_world(scope)
+	except Exception as e:
+		print('Error saving file!')
+		print(traceback.format_exc())
+		return {'CANCELLED'}
+
+	errors = []
+	def write():
 		try:
-			world = save_world()
-			world.store_data(file)
+			write_sef_atomic(filepath, lambda file: write_snapshot(file, snapshot))
 		except Exception as e:
+			errors.append(e)
 			print('Error saving file!')
 			print(traceback.format_exc())
-			return {'CANCELLED'}
+
+	worker = threading.Thread(target=write, daemon=True)
+	worker.start()
+
+	def check_worker():
+		if worker.is_alive():
+			return 0.5
+		if errors:
+			report_in_ui(f"Error saving {filepath}: {errors[0]}", "Export failed", 'ERROR')
+		else:
+			print(f"Finished writing {filepath}")
+			report_in_ui(f"Finished writing {filepath}", "Export finished", 'INFO')
+		return None
+	bpy.app.timers.register(check_worker, first_interval=0.5)
 	return {'FINISHED'}
 
-def traverse_tree(t):
-	yield t
-	for child in t.children:
-		yield from traverse_tree(child)
-		
+def report_in_ui(message, title, icon):
+	def draw(self, context):
+		self.layout.label(text=message)
+	bpy.context.window_manager.popup_menu(draw, title=title, icon=icon)
+
 group_names = ["SKY","BASE","REFLEX","UNK1","FIELD1","FIELD2","FIELD3","UNK2","RIGHT_TRIBUNE","LEFT_TRIBUNE",\
 	"UPPER_TRIBUNE","DOWN_TRIBUNE","SCOREBOARD","ROOF","UNK3","UNK4","UNK5","UNK6","UNK7","UNK8","UNK9","UNK10", \
 	"LIGHT_EFFECT","RIGHT_SIDE","LEFT_SIDE","UPPER_SIDE","DOWN_SIDE","UNK11","UNK12","UNK13","ADS_1","ADS_2",\
 	"ADS_3","REBOUNDS","LIGHTS"]
 
+def base_name(name:str) -> str:
+	# Blender suffixes duplicate datablock names (SKY.001), as happens when several variants are imported
+	return re.sub(r'\.\d{3}$', '', name)
+
 def is_valid_material_name(name:str) -> bool:
 	return all(c in string.hexdigits for c in name)
 
-def save_world():
+def build_group_index(scene):
+	"""
+	Maps every object in the scene to the SEF group it will be exported in, walking the collection tree once.
+	Objects take the group of the nearest group collection above them, and an object linked
+	in several places keeps the first group it was found in, so it is exported only once
+	"""
+	index = {}
+	def visit(collection, group):
+		if base_name(collection.name) in group_names:
+			group = base_name(collection.name)
+		if group is not None:
+			for obj in collection.objects:
+				index.setdefault(obj, group)
+		for child in collection.children:
+			visit(child, group)
+	visit(scene.collection, None)
+	return index
+
+def resolve_export_scope(scene, view_layer, use_selection=False, use_visible=False, groups=None):
+	"""
+	Returns a dict of group name -> list of objects to export, in scene order.
+	Can be limited to selected objects, visible objects and/or a set of group names
+	"""
+	scope = {}
+	for obj, group in build_group_index(scene).items():
+		if groups and group not in groups:
+			continue
+		if use_selection and not obj.select_get(view_layer=view_layer):
+			continue
+		if use_visible and not obj.visible_get(view_layer=view_layer):
+			continue
+		scope.setdefault(group, []).append(obj)
+	return scope
+
+def report_export_scope(scope):
+	total = sum(len(objs) for objs in scope.values())
+	print(f"Exporting {total} objects in {len(scope)} groups:")
+	for group, objs in scope.items():
+		print(f"  {group}: {len(objs)}")
+
+def check_export_names(scope):
+	"""
+	Objects are exported by their name without Blender's .NNN suffix, which is only safe when that
+	name is not taken by another object of the same group in scope. Raises when it is
+	"""
+	for group_name, objs in scope.items():
+		if group_name == "LIGHTS":
+			# Light names are not exported
+			continue
+		exported = {}
+		for obj in objs:
+			other = exported.setdefault(base_name(obj.name), obj)
+			if other is not obj:
+				raise Exception(f"Objects {other.name} and {obj.name} would both be exported as {base_name(obj.name)}, rename one of them before exporting!")
+
+class ObjectSnapshot:
+	"""
+	Everything save_object reads from a mesh object, copied into flat arrays:
+	vertex coordinates, per loop vertex indices, uvs and colors, and the polygon loop ranges
+	"""
+	def __init__(self):
+		self.name        = ''
+		self.material    = ''
+		self.matrix      = ()
+		self.co          = array('f')
+		self.loop_vertex = array('i')
+		self.loop_start  = array('i')
+		self.loop_total  = array('i')
+		self.uv          = array('f')
+		self.color       = None
+
+def foreach_array(collection, attribute, typecode, size, count):
+	values = array(typecode, bytes(array(typecode).itemsize * size * count))
+	collection.foreach_get(attribute, values)
+	return values
+
+def snapshot_object(obj):
+	"""Copies a mesh object with foreach_get, which is much cheaper than reading it vertex by vertex"""
+	snapshot = ObjectSnapshot()
+	snapshot.name = base_name(obj.name)
+	snapshot.material = object_material_name(obj)
+	snapshot.matrix = tuple(tuple(row) for row in obj.matrix_world)
+	mesh = obj.data
+	snapshot.co = foreach_array(mesh.vertices, 'co', 'f', 3, len(mesh.vertices))
+	snapshot.loop_vertex = foreach_array(mesh.loops, 'vertex_index', 'i', 1, len(mesh.loops))
+	snapshot.loop_start = foreach_array(mesh.polygons, 'loop_start', 'i', 1, len(mesh.polygons))
+	snapshot.loop_total = foreach_array(mesh.polygons, 'loop_total', 'i', 1, len(mesh.polygons))
+	if mesh.uv_layers.active is None:
+		raise Exception(f"Object {snapshot.name} has no UV map fix this before exporting!")
+	snapshot.uv = foreach_array(mesh.uv_layers.active.data, 'uv', 'f', 2, len(mesh.loops))
+	if mesh.vertex_colors.active is not None:
+		snapshot.color = foreach_array(mesh.vertex_colors.active.data, 'color', 'f', 4, len(mesh.loops))
+	return snapshot
+
+def build_object(snapshot):
+	"""Builds the same SEFObject as save_object from a snapshot, without touching Blender data"""
+	sef_obj = SEFObject()
+	sef_obj.name = snapshot.name
+	sef_obj.material = snapshot.material
+	m = snapshot.matrix
+	co = snapshot.co
+	for i in range(0, len(co), 3):
+		x, y, z = co[i], co[i+1], co[i+2]
+		sef_obj.verts.append(tuple(m[r][0] * x + m[r][1] * y + m[r][2] * z + m[r][3] for r in range(3)))
+	for start, total in zip(snapshot.loop_start, snapshot.loop_total):
+		loops = range(start, start + total)
+		face = tuple(snapshot.loop_vertex[l] for l in loops)
+		sef_obj.faces.append(face)
+		for l in loops:
+			if snapshot.color is None:
+				sef_obj.vcol.append([255, 255, 255, 255])
+			else:
+				col = [int(i * 255) for i in snapshot.color[4*l:4*l+4]]
+				sef_obj.vcol.append([col[3], col[0], col[1], col[2]])
+			sef_obj.uv.append(None)
+		for vert_idx, l in zip(face, loops):
+			sef_obj.uv[vert_idx] = (snapshot.uv[2*l], snapshot.uv[2*l+1])
+	return sef_obj
+
+def snapshot_world(scope):
+	"""
+	A SEFWorld whose groups hold ObjectSnapshots instead of SEFObjects, sorted as they will be written.
+	Materials, lights and rebounds are small and extracted as usual
+	"""
 	world = SEFWorld()
-	
 	world.weather = bpy.context.scene.name[len("Stadium-"):]
-	
-	for mat in bpy.data.materials:
-		if not is_valid_material_name(mat.name):
-			# Needed to avoid exporting material such as xxxx.001, etc this break SIE
+	world.materials = save_materials(scope)
+	world.lights = [save_light(obj) for obj in scope.get("LIGHTS", [])]
+	world.rebounds = [save_rebound(obj) for obj in scope.get("REBOUNDS", [])]
+	for group_name, objs in scope.items():
+		if group_name in ("LIGHTS", "REBOUNDS") or not objs:
 			continue
-		if not mat.use_nodes or not "Image Texture" in mat.node_tree.nodes:
+		group = SEFGroup()
+		group.name = group_name
+		group.obj_list = sorted((snapshot_object(obj) for obj in objs), key=lambda snapshot:snapshot.name)
+		group.obj_count = len(group.obj_list)
+		world.groups.append(group)
+	return world
+
+def write_snapshot(file, world):
+	"""Writes a snapshot_world result, building one SEFObject at a time"""
+	writer = SEFWriter(file)
+	writer.write_header(world.weather, world.materials, world.lights, len(world.groups))
+	for group in world.groups:
+		writer.write_group(group.name, group.obj_count)
+		for snapshot in group.obj_list:
+			writer.write_object(build_object(snapshot), group.name)
+	writer.write_rebounds(world.rebounds)
+
+def save_world_streaming(file, scope):
+	"""
+	Writes the scene, extracting and writing one object at a time,
+	so only the object being written is held in memory.
+	Group and mesh counts come from the export scope, which is resolved before anything is extracted
+	"""
+	writer = SEFWriter(file)
+	mesh_groups = [(name, objs) for name, objs in scope.items() if name not in ("LIGHTS", "REBOUNDS") and objs]
+	lights = [save_light(obj) for obj in scope.get("LIGHTS", [])]
+	writer.write_header(bpy.context.scene.name[len("Stadium-"):], save_materials(scope), lights, len(mesh_groups))
+
+	for group_name, objs in mesh_groups:
+		writer.write_group(group_name, len(objs))
+		# Same order as SEFWorld.store_data, which sorts objects by name
+		for obj in sorted(objs, key=lambda obj:base_name(obj.name)):
+			writer.write_object(save_object(obj), group_name)
+
+	writer.write_rebounds([save_rebound(obj) for obj in scope.get("REBOUNDS", [])])
+
+def save_materials(scope):
+	"""
+	Materials used by the mesh objects in scope, by their name without Blender's .NNN suffix.
+	Only used materials are exported, so a variant scene gets its own textures and not those
+	of other scenes that happen to use the same material name
+	"""
+	used = {}
+	for group_name, objs in scope.items():
+		if group_name in ("LIGHTS", "REBOUNDS"):
+			continue
+		for obj in objs:
+			if not obj.data.materials or obj.data.materials[0] is None:
+				continue
+			mat = obj.data.materials[0]
+			other = used.setdefault(base_name(mat.name), mat)
+			# Copies such as 0A1B.001 are only merged into 0A1B when they use the same texture
+			if other is not mat and material_texture(other) != material_texture(mat):
+				raise Exception(f"Materials {other.name} and {mat.name} would both be exported as {base_name(mat.name)} but use different textures, rename one of them before exporting!")
+
+	materials = []
+	for name, mat in used.items():
+		if not is_valid_material_name(name):
+			# Objects using these are rejected by save_object with a proper error
+			continue
+		if material_texture(mat) is None:
 			continue
 		sef_material = SEFMaterial()
-		sef_material.name = mat.name
-		sef_material.texture = mat.node_tree.nodes["Image Texture"].image.filepath
+		sef_material.name = name
+		sef_material.texture = material_texture(mat)
 		if not sef_material.texture:
 			# Extra check to avoid exporting empty paths that might break SIE when importing
 			print(f"Material {sef_material.name} has no filepath for the texture it wont be included on the export")
 			continue
-		world.materials.append(sef_material)
-			
-	for collection in traverse_tree(bpy.context.scene.collection):
-		if collection.name not in group_names:
-			continue
-		group = SEFGroup()
-		group.name = collection.name
-		for obj in collection.all_objects:
-			if collection.name == "LIGHTS":
-				light = SEFLight()
-				light.energy = obj.data.energy
-				light.x = obj.location[0]
-				light.y = obj.location[1]
-				light.z = obj.location[2]
-				world.lights.append(light)
-			elif collection.name == "REBOUNDS":
-				rebound = SEFRebound()
-				rebound.name = obj.name
-				rebound.verts = [(obj.matrix_world @ v.co) for v in obj.data.vertices]
-				rebound.parts = len(rebound.verts) // 4
-				world.rebounds.append(rebound)
-			else:
-				sef_obj = SEFObject()
-				sef_obj.name = obj.name
-				if not obj.data.materials:
-					raise Exception(f"Object {sef_obj.name} has no material assigned fix this before exporting!")
-				mat = obj.data.materials[0]
-				if mat is None:
-					# Case for when you unlink the material from the object but still haven't removed the material slot
-					raise Exception(f"Object {sef_obj.name} has no material assigned on slot 0 fix this before exporting!")
-				sef_obj.material = obj.data.materials[0].name
-				if not is_valid_material_name(sef_obj.material):
-					raise Exception(f"Object {sef_obj.name} has an invalid material name {sef_obj.material} fix this before exporting!")
-				sef_obj.verts = [(obj.matrix_world @ v.co) for v in obj.data.vertices]
-				# vert_color and uv extraction
-				mesh = obj.data
-				uv_layer = mesh.uv_layers.active
-				for face in mesh.polygons:
-					sef_obj.faces.append(face.vertices[:])
-					for vert_idx, loop_idx in zip(face.vertices, face.loop_indices):
-						try:
-							col = mesh.vertex_colors.active.data[loop_idx].color
-							col = [int(i * 255) for i in col]
-							col = [col[3], col[0], col[1], col[2]]
-							sef_obj.vcol.append(col)
-						except:
-							sef_obj.vcol.append([255, 255, 255, 255])
-						sef_obj.uv.append(None)
-					for vert_idx, loop_idx in zip(face.vertices, face.loop_indices):
-						sef_obj.uv[vert_idx]=uv_layer.data[loop_idx].uv
-				group.obj_list.append(sef_obj)
+		materials.append(sef_material)
+	return materials
 
-		group.obj_count = len(group.obj_list)
-		if group.obj_count > 0:
-			world.groups.append(group)			
-	return world
+def material_texture(mat):
+	if not mat.use_nodes or not "Image Texture" in mat.node_tree.nodes:
+		return None
+	return mat.node_tree.nodes["Image Texture"].image.filepath
+
+def save_light(obj):
+	light = SEFLight()
+	light.energy = obj.data.energy
+	light.x = obj.location[0]
+	light.y = obj.location[1]
+	light.z = obj.location[2]
+	return light
+
+def save_rebound(obj):
+	rebound = SEFRebound()
+	rebound.name = base_name(obj.name)
+	rebound.verts = [tuple(obj.matrix_world @ v.co) for v in obj.data.vertices]
+	rebound.parts = len(rebound.verts) // 4
+	return rebound
+
+def object_material_name(obj):
+	name = base_name(obj.name)
+	if not obj.data.materials:
+		raise Exception(f"Object {name} has no material assigned fix this before exporting!")
+	mat = obj.data.materials[0]
+	if mat is None:
+		# Case for when you unlink the material from the object but still haven't removed the material slot
+		raise Exception(f"Object {name} has no material assigned on slot 0 fix this before exporting!")
+	material = base_name(mat.name)
+	if not is_valid_material_name(material):
+		raise Exception(f"Object {name} has an invalid material name {material} fix this before exporting!")
+	return material
+
+def save_object(obj):
+	sef_obj = SEFObject()
+	sef_obj.name = base_name(obj.name)
+	sef_obj.material = object_material_name(obj)
+	sef_obj.verts = [tuple(obj.matrix_world @ v.co) for v in obj.data.vertices]
+	# vert_color and uv extraction
+	mesh = obj.data
+	uv_layer = mesh.uv_layers.active
+	for face in mesh.polygons:
+		sef_obj.faces.append(face.vertices[:])
+		for vert_idx, loop_idx in zip(face.vertices, face.loop_indices):
+			try:
+				col = mesh.vertex_colors.active.data[loop_idx].color
+				col = [int(i * 255) for i in col]
+				col = [col[3], col[0], col[1], col[2]]
+				sef_obj.vcol.append(col)
+			except:
+				sef_obj.vcol.append([255, 255, 255, 255])
+			sef_obj.uv.append(None)
+		for vert_idx, loop_idx in zip(face.vertices, face.loop_indices):
+			sef_obj.uv[vert_idx]=tuple(uv_layer.data[loop_idx].uv)
+	return sef_obj
@@ -17,20 +17,51 @@
 #
 # ***** END GPL LICENCE BLOCK *****
 
-import traceback
+import hashlib, struct, traceback
 import bpy
 
 from .sef_definitions import *
 
 def load_sef(filepath):
-	with open(filepath, 'r') as file:
+	try:
+		world = SEFWorld.load(filepath)
+	except Exception as e:
+		print('Error in input file!')
+		print(traceback.format_exc())
+		return {'CANCELLED'}
+	draw_model(world)
+	return {'FINISHED'}
+
+def load_sef_variants(filepaths):
+	"""
+	Loads several SEF files of the same stadium (weather/lighting variants)
+	each one into its own scene, sharing identical geometry and materials between them.
+	Files are parsed and drawn one at a time, only the shared datablocks are kept between them
+	"""
+	try:
+		# Files without a weather line load as the default weather
+		weathers = [SEFWorld.load_weather(filepath) or SEFWorld().weather for filepath in filepaths]
+	except Exception as e:
+		print('Error in input file!')
+		print(traceback.format_exc())
+		return {'CANCELLED'}
+	duplicates = sorted({weather for weather in weathers if weathers.count(weather) > 1})
+	if duplicates:
+		print(f"Several selected files have the same weather ({', '.join(duplicates)}), each variant needs its own Stadium-<weather> scene")
+		return {'CANCELLED'}
+
+	reset_blend()
+	shared = new_shared_data()
+	for filepath in filepaths:
 		try:
-			world = SEFWorld.load_data(file)
+			world = SEFWorld.load(filepath)
 		except Exception as e:
-			print('Error in input file!')
+			print(f'Error in input file {filepath}, variants before it were loaded!')
 			print(traceback.format_exc())
 			return {'CANCELLED'}
-	draw_model(world)
+		draw_scene(world, shared)
+		del world
+	print(f"Loaded {len(filepaths)} variants using {len(shared['meshes'])} meshes and {len(shared['materials'])} materials")
 	return {'FINISHED'}
 
 def add_mesh(name, verts, faces, uv=None, edges=None, material=None, vert_color=None, col_name="Collection"):	
@@ -57,9 +88,38 @@ def add_mesh(name, verts, faces, uv=None, edges=None, material=None, vert_color=
 				if vert_color is not None:
 					vcol_layer.data[vert_idx].color = [i/255 for i in vert_color[vert_idx]]
 
+	return add_object(name, mesh, col_name)
+
+def add_object(name, mesh, col_name="Collection"):
 	obj = bpy.data.objects.new(name, mesh)
 	bpy.data.collections[col_name].objects.link(obj)
 	bpy.context.view_layer.objects.active = obj
+	return obj
+
+def content_hash(obj, texture=''):
+	"""
+	Hash of everything that ends up in the mesh datablock of a SEF object,
+	used to find geometry that is identical between stadium variants
+	"""
+	h = hashlib.sha1()
+	for text in (obj.material, texture):
+		h.update(text.encode())
+		h.update(b'\0')
+	# Packed per vertex and per face, so no text copy of the whole mesh is ever built
+	h.update(struct.pack('<II', len(obj.verts), len(obj.faces)))
+	vertex = struct.Struct('<5d4B')
+	for (x, y, z), (u, v), col in zip(obj.verts, obj.uv, obj.vcol):
+		h.update(vertex.pack(x, y, z, u, v, *col))
+	for face in obj.faces:
+		h.update(struct.pack('<%dI' % (len(face) + 1), len(face), *face))
+	return h.hexdigest()
+
+def rebound_hash(rebound):
+	h = hashlib.sha1()
+	vertex = struct.Struct('<3d')
+	for v in rebound.verts:
+		h.update(vertex.pack(*v))
+	return h.hexdigest()
 
 def load_texture(name, location):
 	curr = bpy.data.materials.new(name=name)
@@ -118,6 +178,16 @@ def reset_blend():
 
 def draw_model(world):
 	reset_blend()
+	draw_scene(world)
+
+def new_shared_data():
+	"""
+	Datablocks reused between variants: materials by (name, texture),
+	meshes by content hash and objects by (name, content hash)
+	"""
+	return {'materials': {}, 'meshes': {}, 'objects': {}}
+
+def draw_scene(world, shared=None):
 	scene_name = 'Stadium-%s' % world.weather
 	if scene_name not in bpy.data.scenes:
 		bpy.ops.scene.new(type='EMPTY')	 
@@ -125,23 +195,44 @@ def draw_model(world):
 	
 	bpy.context.window.scene = bpy.data.scenes[scene_name]
 	
+	if shared is None:
+		shared = new_shared_data()
+
 	# First load all materials
 	loaded_materials = {}
+	textures = {}
 	for material in world.materials:
 		if not material.texture:
 			print(f"Material {material.name} has an invalid filepath it wont be loaded")
 			continue
-		loaded_materials[material.name] = load_texture(material.name, material.texture)
+		key = (material.name, material.texture)
+		if key not in shared['materials']:
+			shared['materials'][key] = load_texture(material.name, material.texture)
+		loaded_materials[material.name] = shared['materials'][key]
+		textures[material.name] = material.texture
 	
 	# Next, load all objects
 	for group in world.groups:
 		collection = bpy.data.collections.new(group.name)
 		bpy.context.scene.collection.children.link(collection)
 		for obj in group.obj_list:
-			material = loaded_materials.get(obj.material, None)
-			if material is None:
-				material = create_empty_material(obj.material)
-			add_mesh(obj.name, obj.verts, obj.faces, obj.uv, vert_color=obj.vcol, material=material, col_name=group.name)
+			key = content_hash(obj, textures.get(obj.material, ''))
+			shared_obj = shared['objects'].get((obj.name, key), None)
+			if shared_obj is not None:
+				# Same object in an already loaded variant, just link it into this scene
+				if shared_obj.name not in collection.objects:
+					collection.objects.link(shared_obj)
+				continue
+			if key in shared['meshes']:
+				new_obj = add_object(obj.name, shared['meshes'][key], col_name=collection.name)
+			else:
+				material = loaded_materials.get(obj.material, None)
+				if material is None:
+					material = create_empty_material(obj.material)
+					loaded_materials[obj.material] = material
+				new_obj = add_mesh(obj.name, obj.verts, obj.faces, obj.uv, vert_color=obj.vcol, material=material, col_name=collection.name)
+				shared['meshes'][key] = new_obj.data
+			shared['objects'][(obj.name, key)] = new_obj
 
 
 	# Load all lights
@@ -174,8 +265,14 @@ def draw_model(world):
 		if len(rebound.verts) % 4 != 0:
 			print(f"Rebound '{rebound.name}': vertex count must be a multiple of 4 (quads expected), rebound not imported")
 			continue
+		key = (rebound.name, rebound_hash(rebound))
+		shared_obj = shared['objects'].get(key, None)
+		if shared_obj is not None:
+			if shared_obj.name not in collection.objects:
+				collection.objects.link(shared_obj)
+			continue
 		faces = [(i, i + 1, i + 2, i + 3) for i in range(0, len(rebound.verts), 4)]
-		add_mesh(rebound.name, rebound.verts, faces, col_name="REBOUNDS")
+		shared['objects'][key] = add_mesh(rebound.name, rebound.verts, faces, col_name=collection.name)
 	
 	# Refresh render
 	bpy.context.evaluated_depsgraph_get().update()
@@ -18,6 +18,68 @@
 # ***** END GPL LICENCE BLOCK *****
 
 import os, math, traceback
+import gzip, lzma, tempfile
+
+GZIP_MAGIC = b'\x1f\x8b'
+XZ_MAGIC   = b'\xfd7zXZ\x00'
+
+# Read once at import, os.umask can only be queried by setting it, which is not thread safe
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+def sef_compression(filepath):
+	"""Compression used when writing filepath, picked from its extension ('gz', 'xz' or None)"""
+	if filepath.lower().endswith('.gz'):
+		return 'gz'
+	if filepath.lower().endswith('.xz'):
+		return 'xz'
+	return None
+
+def open_sef(filepath, mode='r', compression=None):
+	"""
+	Opens a SEF file in text mode, transparently (de)compressing gzip and xz files as a stream.
+	When reading, compression is detected from the magic bytes, when writing it is taken
+	from the compression argument or else from the file extension
+	"""
+	if mode == 'r':
+		with open(filepath, 'rb') as file:
+			magic = file.read(len(XZ_MAGIC))
+		if magic.startswith(GZIP_MAGIC):
+			return gzip.open(filepath, 'rt')
+		if magic.startswith(XZ_MAGIC):
+			return lzma.open(filepath, 'rt')
+		return open(filepath, 'r')
+
+	if compression is None:
+		compression = sef_compression(filepath)
+	if compression == 'gz':
+		return gzip.open(filepath, 'wt', newline='\r\n')
+	if compression == 'xz':
+		return lzma.open(filepath, 'wt', newline='\r\n')
+	return open(filepath, 'w', newline='\r\n')
+
+def write_sef_atomic(filepath, write):
+	"""
+	Calls write(file) with a temporary file in the same directory as filepath, which replaces filepath
+	only once write succeeded, so a failed export never leaves a truncated file behind
+	"""
+	directory, name = os.path.split(os.path.abspath(filepath))
+	# A unique name, so concurrent exports to the same target don't write into each other's file
+	handle, temp_path = tempfile.mkstemp(prefix=name + '.', suffix='.tmp', dir=directory)
+	os.close(handle)
+	try:
+		with open_sef(temp_path, 'w', sef_compression(filepath)) as file:
+			write(file)
+		# mkstemp creates the file readable by its owner only, give it the permissions a plain open would
+		if os.path.exists(filepath):
+			os.chmod(temp_path, os.stat(filepath).st_mode & 0o777)
+		else:
+			os.chmod(temp_path, 0o666 & ~UMASK)
+		os.replace(temp_path, filepath)
+	except:
+		if os.path.exists(temp_path):
+			os.remove(temp_path)
+		raise
 
 class SEFBase:
 	def __repr__(self):
@@ -71,16 +133,37 @@ class SEFWorld(SEFBase):
 		self.weather   = 'DF'
 			
 	@staticmethod
-	def load_data(file):
+	def load(filepath):
+		with open_sef(filepath) as file:
+			return SEFWorld.load_data(file, os.path.dirname(filepath))
+
+	def save(self, filepath):
+		with open_sef(filepath, 'w') as file:
+			self.store_data(file)
+
+	@staticmethod
+	def load_weather(filepath):
+		"""Reads only the header and weather of a SEF file, without loading the rest"""
+		with open_sef(filepath) as file:
+			return SEFWorld.read_weather(file)
+
+	@staticmethod
+	def read_weather(file):
 		header = file.readline()
 		if header != '//Stadium Exchange File (c)2007 warpjavier\n':
 			raise Exception("Wrong file header!")
 
-		world = SEFWorld()
 		for line in file:
 			if line.find('Weather') >= 0:
-				world.weather = line.split('=')[1].replace('"','').replace(' ','').strip()
-				break
+				return line.split('=')[1].replace('"','').replace(' ','').strip()
+		return None
+
+	@staticmethod
+	def load_data(file, basedir=None):
+		world = SEFWorld()
+		weather = SEFWorld.read_weather(file)
+		if weather is not None:
+			world.weather = weather
 
 		next(file)
 		for line in file:
@@ -106,7 +189,9 @@ class SEFWorld(SEFBase):
 			from os import path
 			if not path.exists(m.texture):
 				# Lets be more inclusive in this rewrite, and search for relative materials path as well
-				m.texture = path.join(path.dirname(file.name), path.basename(m.texture.replace('\\', os.sep)))
+				if basedir is None:
+					basedir = path.dirname(file.name)
+				m.texture = path.join(basedir, path.basename(m.texture.replace('\\', os.sep)))
 				if not path.exists(m.texture):
 					raise Exception('Error '+ m.texture + ' not found.')
 			world.materials.append(m)
@@ -202,44 +287,64 @@ class SEFWorld(SEFBase):
 		return world
 
 	def store_data(self, file):
+		writer = SEFWriter(file)
+		groups = [gr for gr in self.groups if gr.obj_count > 0]
+		writer.write_header(self.weather, self.materials, self.lights, len(groups))
+		for group in groups:
+			writer.write_group(group.name, group.obj_count)
+			group.obj_list.sort(key=lambda obj:obj.name)
+			for o in group.obj_list:
+				writer.write_object(o, group.name)
+		writer.write_rebounds(self.rebounds)
+
+class SEFWriter:
+	"""
+	Writes a SEF file section by section, so callers can produce objects one at a time
+	instead of building a whole SEFWorld first. Sections must be written in order:
+	header, then each group followed by its objects, then rebounds
+	"""
+	def __init__(self, file):
+		self.file = file
+
+	def write_header(self, weather, materials, lights, mesh_count):
+		file = self.file
 		file.write("//Stadium Exchange File (c)2007 warpjavier\n\n")
 
-		file.write("Weather = \"%s\"\n\n" % self.weather)
+		file.write("Weather = \"%s\"\n\n" % weather)
 
-		file.write("Materials = %d\n\n" % len(self.materials))
-		for material in self.materials:
+		file.write("Materials = %d\n\n" % len(materials))
+		for material in materials:
 			file.write("%s \"%s\"\n" % (material.name, material.texture))
 
-		file.write("\nLights = %d\n\n"% len(self.lights))
-		for l in self.lights:
+		file.write("\nLights = %d\n\n"% len(lights))
+		for l in lights:
 			file.write("%8f %8f %8f %8f\n" % (l.energy, l.x, l.y, l.z))
 
-		o_count=0
-		for gr in self.groups:
-			if gr.obj_count > 0:
-				o_count += 1
-		file.write("\nMeshes = %d\n\n" % o_count)
-		
-		for group in self.groups:
-			if group.obj_count > 0:
-				file.write("Name = \"%s\" %d\n" % (group.name, group.obj_count))
-				group.obj_list.sort(key=lambda obj:obj.name)
-				for o in group.obj_list:
-					name = o.name[len(group.name)+1:] # Remove group prefix
-					file.write("%s %s\n%d\n" % (name, o.material, len(o.verts)))
-					for i in range(len(o.verts)):
-						file.write("%8f %8f %8f " % tuple(o.verts[i]))
-						u,v = o.uv[i][0], o.uv[i][1]
-						file.write("%8f %8f 0x" % (u, 1-v))
-						for j in range(len(o.vcol[i])):
-							file.write("%02x" % o.vcol[i][j])
-						file.write("\n")
-					file.write("%d\n" % len(o.faces))
-					for f in o.faces:
-						file.write("%d %d %d\n" % tuple(f))
-		if len(self.rebounds) > 0:
+		file.write("\nMeshes = %d\n\n" % mesh_count)
+
+	def write_group(self, name, obj_count):
+		self.file.write("Name = \"%s\" %d\n" % (name, obj_count))
+
+	def write_object(self, o, group_name):
+		file = self.file
+		name = o.name[len(group_name)+1:] # Remove group prefix
+		file.write("%s %s\n%d\n" % (name, o.material, len(o.verts)))
+		for i in range(len(o.verts)):
+			file.write("%8f %8f %8f " % tuple(o.verts[i]))
+			u,v = o.uv[i][0], o.uv[i][1]
+			file.write("%8f %8f 0x" % (u, 1-v))
+			for j in range(len(o.vcol[i])):
+				file.write("%02x" % o.vcol[i][j])
+			file.write("\n")
+		file.write("%d\n" % len(o.faces))
+		for f in o.faces:
+			file.write("%d %d %d\n" % tuple(f))
+
+	def write_rebounds(self, rebounds):
+		file = self.file
+		if len(rebounds) > 0:
 			file.write("\nRebounds\n")
-			for r in self.rebounds:
+			for r in rebounds:
 				file.write("\"%s\" = %d\n" % (r.name, r.parts))
 				for p in range(len(r.verts)):
 					file.write("%8f %8f %8f\n" % tuple(r.verts[p]))
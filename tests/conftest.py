@@ -0,0 +1,85 @@
+# Loads the add-on as the io_scene_sef package so its pure Python parts can be tested
+# outside Blender. When bpy is not available, the few names used at import time are stubbed.
+
+import importlib.util, os, sys, types
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _stub_blender():
+	bpy = types.ModuleType('bpy')
+	bpy.types = types.SimpleNamespace(Operator=type('Operator', (), {}), OperatorFileListElement=None)
+	bpy.props = types.ModuleType('bpy.props')
+	for name in ('StringProperty', 'CollectionProperty', 'BoolProperty', 'EnumProperty'):
+		setattr(bpy.props, name, lambda **kwargs: None)
+	bpy_extras = types.ModuleType('bpy_extras')
+	bpy_extras.io_utils = types.ModuleType('bpy_extras.io_utils')
+	bpy_extras.io_utils.ImportHelper = type('ImportHelper', (), {})
+	bpy_extras.io_utils.ExportHelper = type('ExportHelper', (), {'check': lambda self, context: False})
+	bpy_extras.io_utils.path_reference_mode = None
+	sys.modules.update({
+		'bpy': bpy,
+		'bpy.props': bpy.props,
+		'bpy_extras': bpy_extras,
+		'bpy_extras.io_utils': bpy_extras.io_utils,
+	})
+
+try:
+	import bpy
+except ImportError:
+	_stub_blender()
+
+if 'io_scene_sef' not in sys.modules:
+	spec = importlib.util.spec_from_file_location('io_scene_sef', os.path.join(ROOT, '__init__.py'),
+		submodule_search_locations=[ROOT])
+	module = importlib.util.module_from_spec(spec)
+	sys.modules['io_scene_sef'] = module
+	spec.loader.exec_module(module)
+
+from io_scene_sef.sef_definitions import *
+
+@pytest.fixture
+def make_object():
+	"""Factory for a small SEF object, any attribute can be overridden"""
+	def make(name, **attributes):
+		obj = SEFObject()
+		obj.name     = name
+		obj.material = '0A1B'
+		obj.verts    = [(0, 0, 0), (1.5, 0, 0), (0, 1, -2)]
+		obj.uv       = [(0, 0.25), (1, 0), (0.5, 1)]
+		obj.vcol     = [(255, 1, 2, 3), (128, 255, 0, 16), (0, 0, 0, 0)]
+		obj.faces    = [(0, 1, 2)]
+		for key, value in attributes.items():
+			setattr(obj, key, value)
+		return obj
+	return make
+
+@pytest.fixture
+def make_world(make_object):
+	"""Factory for a small world with a material, a light, one group of two objects and a rebound"""
+	def make():
+		world = SEFWorld()
+		world.weather = 'RN'
+		material = SEFMaterial()
+		material.name    = '0A1B'
+		material.texture = 'C:\\tex\\grass.png'
+		world.materials.append(material)
+		light = SEFLight()
+		light.energy, light.x, light.y, light.z = 2.5, 1, -2, 30.25
+		world.lights.append(light)
+		group = SEFGroup()
+		group.name     = 'SKY'
+		group.obj_list = [make_object('SKY-b'), make_object('SKY-a')]
+		group.obj_count = 2
+		world.groups.append(group)
+		empty = SEFGroup()
+		empty.name = 'ROOF'
+		world.groups.append(empty)
+		rebound = SEFRebound()
+		rebound.name  = 'R1'
+		rebound.parts = 1
+		rebound.verts = [(0, 0, 0), (1, 0, 0), (1, 1, 0), (0, 1, 0)]
+		world.rebounds.append(rebound)
+		return world
+	return make
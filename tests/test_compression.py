@@ -0,0 +1,68 @@
+import gzip, io, lzma
+
+import pytest
+
+from io_scene_sef import ExportSEF, sef_export_path
+from io_scene_sef.sef_definitions import *
+
+@pytest.fixture
+def world(tmp_path, make_world):
+	# load_data checks that textures exist
+	texture = tmp_path / 'grass.png'
+	texture.write_bytes(b'')
+	world = make_world()
+	world.materials[0].texture = str(texture)
+	return world
+
+@pytest.mark.parametrize('ext', ['.sef', '.sef.gz', '.sef.xz'])
+def test_round_trip(world, tmp_path, ext):
+	filepath = str(tmp_path / ('stadium' + ext))
+	world.save(filepath)
+	assert repr(SEFWorld.load(filepath)) == repr(SEFWorld.load_data(io.StringIO(_store(world))))
+
+def _store(world):
+	file = io.StringIO()
+	world.store_data(file)
+	return file.getvalue()
+
+@pytest.mark.parametrize('ext,opener', [('.sef.gz', gzip.open), ('.sef.xz', lzma.open)])
+def test_save_compresses_by_extension(world, tmp_path, ext, opener):
+	filepath = str(tmp_path / ('stadium' + ext))
+	world.save(filepath)
+	with opener(filepath, 'rt', newline='') as file:
+		assert file.read() == _store(world).replace('\n', '\r\n')
+
+def test_load_detects_compression_from_magic_bytes(world, tmp_path):
+	filepath = str(tmp_path / 'stadium.sef')
+	with gzip.open(filepath, 'wt') as file:
+		world.store_data(file)
+	assert SEFWorld.load(filepath).weather == 'RN'
+
+def test_relative_textures_found_next_to_compressed_file(world, tmp_path):
+	world.materials[0].texture = 'C:\\missing\\grass.png'
+	filepath = str(tmp_path / 'stadium.sef.xz')
+	world.save(filepath)
+	assert SEFWorld.load(filepath).materials[0].texture == str(tmp_path / 'grass.png')
+
+def test_load_data_from_stream_without_name(world):
+	assert SEFWorld.load_data(io.StringIO(_store(world))).weather == 'RN'
+
+@pytest.mark.parametrize('filepath,compression,expected', [
+	('stadium.sef', 'NONE', 'stadium.sef'),
+	('stadium', 'NONE', 'stadium.sef'),
+	('stadium.sef.gz', 'NONE', 'stadium.sef.gz'),
+	('stadium.sef.gz.sef', 'NONE', 'stadium.sef.gz'),
+	('STADIUM.SEF.XZ', 'NONE', 'STADIUM.sef.xz'),
+	('stadium.sef', 'GZ', 'stadium.sef.gz'),
+	('stadium.sef.gz', 'XZ', 'stadium.sef.xz'),
+])
+def test_sef_export_path(filepath, compression, expected):
+	assert sef_export_path(filepath, compression) == expected
+
+def test_export_dialog_shows_the_written_file():
+	operator = ExportSEF()
+	operator.filepath = '/tmp/stadium.sef'
+	operator.compression = 'GZ'
+	assert operator.check(None)
+	assert operator.filepath == '/tmp/stadium.sef.gz'
+	assert not operator.check(None)
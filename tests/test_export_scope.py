@@ -0,0 +1,79 @@
+from types import SimpleNamespace
+
+import pytest
+
+from io_scene_sef.export_actions import build_group_index, check_export_names, resolve_export_scope, save_materials
+
+class Collection:
+	def __init__(self, name, objects=(), children=()):
+		self.name     = name
+		self.objects  = list(objects)
+		self.children = list(children)
+
+class Object:
+	def __init__(self, name, selected=True, visible=True, material=None):
+		self.name     = name
+		self.selected = selected
+		self.visible  = visible
+		self.data     = SimpleNamespace(materials=[material] if material else [])
+
+	def select_get(self, view_layer=None):
+		return self.selected
+
+	def visible_get(self, view_layer=None):
+		return self.visible
+
+class Scene:
+	def __init__(self, *children):
+		self.collection = Collection('Scene Collection', children=children)
+
+def test_nested_collections_export_objects_once():
+	a, b, c = Object('SKY-a'), Object('SKY-b'), Object('ROOF-c')
+	# b sits in a plain sub collection of SKY and is also linked into ROOF, ROOF is nested inside SKY
+	roof = Collection('ROOF', [c, b])
+	sky = Collection('SKY', [a], [Collection('Details', [b]), roof])
+	scope = resolve_export_scope(Scene(sky), None)
+	assert scope == {'SKY': [a, b], 'ROOF': [c]}
+
+def test_suffixed_group_collections_are_merged():
+	a, b = Object('SKY-a'), Object('SKY-b')
+	scene = Scene(Collection('SKY', [a]), Collection('SKY.001', [b]))
+	assert build_group_index(scene) == {a: 'SKY', b: 'SKY'}
+
+def test_objects_outside_groups_are_ignored():
+	a = Object('SKY-a')
+	scene = Scene(Collection('Collection', [Object('Camera')]), Collection('SKY', [a]))
+	assert resolve_export_scope(scene, None) == {'SKY': [a]}
+
+def test_scope_filters():
+	a, b, c = Object('SKY-a', selected=False), Object('SKY-b', visible=False), Object('ROOF-c')
+	scene = Scene(Collection('SKY', [a, b]), Collection('ROOF', [c]))
+	assert resolve_export_scope(scene, None, use_selection=True) == {'SKY': [b], 'ROOF': [c]}
+	assert resolve_export_scope(scene, None, use_visible=True) == {'SKY': [a], 'ROOF': [c]}
+	assert resolve_export_scope(scene, None, groups={'ROOF'}) == {'ROOF': [c]}
+
+def Material(name, texture):
+	nodes = {"Image Texture": SimpleNamespace(image=SimpleNamespace(filepath=texture))}
+	return SimpleNamespace(name=name, use_nodes=True, node_tree=SimpleNamespace(nodes=nodes))
+
+def test_suffixed_object_names_are_stripped_when_unique():
+	check_export_names({'SKY': [Object('SKY-a.001'), Object('SKY-b')], 'LIGHTS': [Object('Light'), Object('Light.001')]})
+
+def test_suffixed_object_names_colliding_raise():
+	with pytest.raises(Exception, match='SKY-a and SKY-a.001'):
+		check_export_names({'SKY': [Object('SKY-a'), Object('SKY-a.001')]})
+
+def test_material_copies_with_same_texture_are_merged():
+	scope = {'SKY': [Object('SKY-a', material=Material('0A1B', 'grass.png')),
+	                 Object('SKY-b', material=Material('0A1B.001', 'grass.png'))]}
+	assert [(m.name, m.texture) for m in save_materials(scope)] == [('0A1B', 'grass.png')]
+
+def test_material_copies_with_other_texture_raise():
+	scope = {'SKY': [Object('SKY-a', material=Material('0A1B', 'grass.png')),
+	                 Object('SKY-b', material=Material('0A1B.001', 'snow.png'))]}
+	with pytest.raises(Exception, match='0A1B and 0A1B.001'):
+		save_materials(scope)
+
+def test_only_materials_in_scope_are_exported():
+	scope = {'SKY': [Object('SKY-a', material=Material('0A1B.001', 'night.png'))]}
+	assert [(m.name, m.texture) for m in save_materials(scope)] == [('0A1B', 'night.png')]
@@ -0,0 +1,116 @@
+from unittest import mock
+
+import pytest
+
+from io_scene_sef import import_actions
+from io_scene_sef.import_actions import content_hash, draw_scene, load_sef_variants, new_shared_data, rebound_hash
+from io_scene_sef.sef_definitions import *
+
+def test_identical_objects_hash_the_same(make_object):
+	assert content_hash(make_object('SKY-a'), 'grass.png') == content_hash(make_object('SKY-b'), 'grass.png')
+
+@pytest.mark.parametrize('texture,attributes', [
+	('snow.png', {}),
+	('grass.png', {'material': '0A1C'}),
+	('grass.png', {'vcol': [(255, 1, 2, 3), (128, 255, 0, 16), (0, 0, 0, 1)]}),
+	('grass.png', {'uv': [(0, 0.25), (1, 0), (0.5, 0.5)]}),
+	('grass.png', {'verts': [(0, 0, 0), (1.5, 0, 0), (0, 1, -3)]}),
+	('grass.png', {'faces': [(0, 2, 1)]}),
+])
+def test_content_changes_change_the_hash(make_object, texture, attributes):
+	assert content_hash(make_object('SKY-a', **attributes), texture) != content_hash(make_object('SKY-a'), 'grass.png')
+
+def test_rebound_hash():
+	a, b = SEFRebound(), SEFRebound()
+	a.verts = [(0, 0, 0), (1, 0, 0), (1, 1, 0), (0, 1, 0)]
+	b.verts = list(a.verts)
+	assert rebound_hash(a) == rebound_hash(b)
+	b.verts[3] = (0, 1, 1)
+	assert rebound_hash(a) != rebound_hash(b)
+
+class Objects(dict):
+	def link(self, obj):
+		if obj.name in self:
+			raise RuntimeError(f"Object '{obj.name}' already in collection")
+		self[obj.name] = obj
+
+class Collection:
+	def __init__(self, name):
+		self.name    = name
+		self.objects = Objects()
+
+class Object:
+	def __init__(self, name, mesh):
+		self.name = name
+		self.data = mesh
+
+@pytest.fixture
+def blender(monkeypatch):
+	"""Replaces bpy and the datablock creating helpers of import_actions, recording what gets created"""
+	bpy = mock.MagicMock()
+	collections = []
+	def new_collection(name):
+		collections.append(Collection(name))
+		return collections[-1]
+	bpy.data.collections.new.side_effect = new_collection
+	meshes = []
+	def add_mesh(name, verts, faces, uv=None, edges=None, material=None, vert_color=None, col_name="Collection"):
+		meshes.append(name)
+		return add_object(name, 'mesh-%s' % name, col_name)
+	def add_object(name, mesh, col_name="Collection"):
+		obj = Object(name, mesh)
+		collections[-1].objects.link(obj)
+		return obj
+	monkeypatch.setattr(import_actions, 'bpy', bpy)
+	monkeypatch.setattr(import_actions, 'add_mesh', add_mesh)
+	monkeypatch.setattr(import_actions, 'add_object', add_object)
+	monkeypatch.setattr(import_actions, 'load_texture', lambda name, location: 'material-%s' % name)
+	monkeypatch.setattr(import_actions, 'create_empty_material', lambda name: 'empty-%s' % name)
+	return mock.Mock(bpy=bpy, collections=collections, meshes=meshes)
+
+def variant(weather, *objs):
+	world = SEFWorld()
+	world.weather = weather
+	material = SEFMaterial()
+	material.name    = '0A1B'
+	material.texture = 'grass.png'
+	world.materials.append(material)
+	group = SEFGroup()
+	group.name     = 'SKY'
+	group.obj_list = list(objs)
+	group.obj_count = len(objs)
+	world.groups.append(group)
+	return world
+
+def test_variants_share_identical_objects_and_meshes(blender, make_object):
+	day_colours, rain_colours = [(0, 0, 0, 0)] * 3, [(255, 255, 255, 255)] * 3
+	shared = new_shared_data()
+	draw_scene(variant('DF', make_object('SKY-a'), make_object('SKY-b', vcol=day_colours)), shared)
+	day = blender.collections[0]
+	draw_scene(variant('RN', make_object('SKY-a'), make_object('SKY-b', vcol=rain_colours), make_object('SKY-c')), shared)
+	rain = next(c for c in blender.collections[1:] if c.name == 'SKY')
+
+	# SKY-a is the same object in both scenes
+	assert rain.objects['SKY-a'] is day.objects['SKY-a']
+	# SKY-b has other vertex colours, so it gets its own mesh
+	assert rain.objects['SKY-b'] is not day.objects['SKY-b']
+	# SKY-c has the content of SKY-a under another name, a new object using the same mesh
+	assert rain.objects['SKY-c'].data == day.objects['SKY-a'].data
+	assert blender.meshes == ['SKY-a', 'SKY-b', 'SKY-b']
+
+def test_duplicate_object_in_one_file_is_linked_once(blender, make_object):
+	draw_scene(variant('DF', make_object('SKY-a'), make_object('SKY-a')), new_shared_data())
+	assert list(blender.collections[0].objects) == ['SKY-a']
+	assert blender.meshes == ['SKY-a']
+
+def test_variants_with_same_weather_are_refused(monkeypatch, tmp_path, make_world):
+	filepaths = []
+	for name in ('day.sef', 'day_lit.sef'):
+		world = make_world()
+		world.materials = []
+		world.save(str(tmp_path / name))
+		filepaths.append(str(tmp_path / name))
+	reset_blend = mock.Mock()
+	monkeypatch.setattr(import_actions, 'reset_blend', reset_blend)
+	assert load_sef_variants(filepaths) == {'CANCELLED'}
+	reset_blend.assert_not_called()
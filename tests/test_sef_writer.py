@@ -0,0 +1,72 @@
+import io
+
+import pytest
+
+from io_scene_sef.sef_definitions import *
+
+# Output of SEFWorld.store_data before it was split into SEFWriter
+EXPECTED = (
+	'//Stadium Exchange File (c)2007 warpjavier\n\n'
+	'Weather = "RN"\n\n'
+	'Materials = 1\n\n'
+	'0A1B "C:\\tex\\grass.png"\n\n'
+	'Lights = 1\n\n'
+	'2.500000 1.000000 -2.000000 30.250000\n\n'
+	'Meshes = 1\n\n'
+	'Name = "SKY" 2\n'
+	'a 0A1B\n3\n'
+	'0.000000 0.000000 0.000000 0.000000 0.750000 0xff010203\n'
+	'1.500000 0.000000 0.000000 1.000000 1.000000 0x80ff0010\n'
+	'0.000000 1.000000 -2.000000 0.500000 0.000000 0x00000000\n'
+	'1\n0 1 2\n'
+	'b 0A1B\n3\n'
+	'0.000000 0.000000 0.000000 0.000000 0.750000 0xff010203\n'
+	'1.500000 0.000000 0.000000 1.000000 1.000000 0x80ff0010\n'
+	'0.000000 1.000000 -2.000000 0.500000 0.000000 0x00000000\n'
+	'1\n0 1 2\n\n'
+	'Rebounds\n'
+	'"R1" = 1\n'
+	'0.000000 0.000000 0.000000\n'
+	'1.000000 0.000000 0.000000\n'
+	'1.000000 1.000000 0.000000\n'
+	'0.000000 1.000000 0.000000\n'
+)
+
+def test_store_data_matches_baseline(make_world):
+	file = io.StringIO()
+	make_world().store_data(file)
+	assert file.getvalue() == EXPECTED
+
+def test_writer_sections_match_store_data(make_world, make_object):
+	world = make_world()
+	file = io.StringIO()
+	writer = SEFWriter(file)
+	writer.write_header(world.weather, world.materials, world.lights, 1)
+	writer.write_group('SKY', 2)
+	for name in ('SKY-a', 'SKY-b'):
+		writer.write_object(make_object(name), 'SKY')
+	writer.write_rebounds(world.rebounds)
+	assert file.getvalue() == EXPECTED
+
+def test_write_sef_atomic_keeps_target_on_error(tmp_path):
+	target = tmp_path / 'stadium.sef'
+	target.write_text('old')
+	def failing_write(file):
+		file.write('partial')
+		raise Exception('missing material')
+	with pytest.raises(Exception, match='missing material'):
+		write_sef_atomic(str(target), failing_write)
+	assert target.read_text() == 'old'
+	assert list(tmp_path.iterdir()) == [target]
+
+def test_write_sef_atomic_concurrent_writes_use_their_own_temp_file(tmp_path):
+	target = str(tmp_path / 'stadium.sef')
+	def inner(file):
+		file.write('inner')
+	def outer(file):
+		file.write('outer')
+		# Another export to the same target finishing while this one is still writing
+		write_sef_atomic(target, inner)
+	write_sef_atomic(target, outer)
+	assert open(target).read() == 'outer'
+	assert [p.name for p in tmp_path.iterdir()] == ['stadium.sef']
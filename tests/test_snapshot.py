@@ -0,0 +1,61 @@
+import io
+from types import SimpleNamespace
+
+from io_scene_sef.export_actions import build_object, snapshot_object, write_snapshot
+from io_scene_sef.sef_definitions import *
+
+class Collection(list):
+	"""Stands in for a bpy_prop_collection, foreach_get reads the given attribute of every item"""
+	def __init__(self, attribute, values, size=1):
+		super().__init__(range(len(values) // size))
+		self.attribute = attribute
+		self.values    = values
+
+	def foreach_get(self, attribute, buffer):
+		assert attribute == self.attribute
+		buffer[:] = type(buffer)(buffer.typecode, self.values)
+
+def triangle(colors=True):
+	"""One triangle, moved by (10, 20, 30), with uvs and colors set per loop"""
+	mesh = SimpleNamespace(
+		materials=[SimpleNamespace(name='0A1B.001')],
+		vertices=Collection('co', [0, 0, 0, 1, 0, 0, 0, 1, 0], 3),
+		loops=Collection('vertex_index', [0, 2, 1]),
+		polygons=Collection('loop_start', [0]),
+		uv_layers=SimpleNamespace(active=SimpleNamespace(data=Collection('uv', [0, 0, 0, 1, 1, 0], 2))),
+		vertex_colors=SimpleNamespace(active=SimpleNamespace(data=Collection('color', [1, 0, 0, 1, 0, 1, 0, 0.5, 0, 0, 1, 0], 4)) if colors else None),
+	)
+	polygons = mesh.polygons
+	def foreach_get(attribute, buffer):
+		buffer[:] = type(buffer)(buffer.typecode, {'loop_start': [0], 'loop_total': [3]}[attribute])
+	polygons.foreach_get = foreach_get
+	matrix = [(1, 0, 0, 10), (0, 1, 0, 20), (0, 0, 1, 30), (0, 0, 0, 1)]
+	return SimpleNamespace(name='SKY-a.001', data=mesh, matrix_world=matrix)
+
+def test_snapshot_builds_the_object_save_object_would():
+	obj = build_object(snapshot_object(triangle()))
+	assert obj.name == 'SKY-a'
+	assert obj.material == '0A1B'
+	assert obj.verts == [(10, 20, 30), (11, 20, 30), (10, 21, 30)]
+	assert obj.faces == [(0, 2, 1)]
+	# Colors are per loop, in ARGB order
+	assert obj.vcol == [[255, 255, 0, 0], [127, 0, 255, 0], [0, 0, 0, 255]]
+	# UVs are per vertex, from the loop using it
+	assert obj.uv == [(0, 0), (1, 0), (0, 1)]
+
+def test_snapshot_without_colors_is_white():
+	assert build_object(snapshot_object(triangle(colors=False))).vcol == [[255, 255, 255, 255]] * 3
+
+def test_write_snapshot_matches_store_data(make_world):
+	world = make_world()
+	snapshot = make_world()
+	triangle_snapshot = snapshot_object(triangle())
+	for group in (world.groups[0], snapshot.groups[0]):
+		group.obj_count = 1
+	world.groups[0].obj_list = [build_object(triangle_snapshot)]
+	snapshot.groups = [snapshot.groups[0]]
+	snapshot.groups[0].obj_list = [triangle_snapshot]
+	expected, written = io.StringIO(), io.StringIO()
+	world.store_data(expected)
+	write_snapshot(written, snapshot)
+	assert written.getvalue() == expected.getvalue()